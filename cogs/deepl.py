@@ -149,6 +149,10 @@ class Translation(commands.Cog):
 
             await ctx.respond(embed=embed, ephemeral=True)
             return
+
+        # defer before translating, discord only gives us 3 seconds to respond
+        await ctx.defer()
+
         try:
             translated_text = await asyncio.to_thread(
                 translate,
@@ -163,22 +167,25 @@ class Translation(commands.Cog):
                 description=f"An error occurred while translating the text:\n\n{e}",
             ).build()
 
-            await ctx.respond(embed=embed, ephemeral=True)
+            await ctx.followup.send(embed=embed)
             return
 
-        embed = EmbedBuilder(
+        original_embed = EmbedBuilder(
             title=f"Original Text - {source_language or 'Auto Detect'}",
             description=f"{text}",
         ).build()
 
-        await ctx.respond(embed=embed)
-
-        embed = EmbedBuilder(
+        translated_embed = EmbedBuilder(
             title=f"Translated Text - {target_language}",
             description=f"{translated_text}",
         ).build()
 
-        await ctx.send(embed=embed)
+        # discord limits the embeds of one message to 6000 characters in total
+        if len(original_embed) + len(translated_embed) <= 6000:
+            await ctx.followup.send(embeds=[original_embed, translated_embed])
+        else:
+            await ctx.followup.send(embed=original_embed)
+            await ctx.send(embed=translated_embed)
 
         Log(f"Translate command used by $ in {ctx.guild}.", ctx.author)
 
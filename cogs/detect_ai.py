@@ -1,12 +1,20 @@
 import asyncio
+import atexit
 import colorsys
+import contextlib
+import hashlib
+import operator
+import os
+import shelve
+import time
+from collections.abc import AsyncIterator
 from dataclasses import dataclass
 from enum import Enum
-from typing import Literal
+from typing import Literal, TypedDict
 
-import bs4
 import discord
 import undetected_chromedriver as uc
+from cachetools import TTLCache
 from discord import option
 from discord.commands.context import ApplicationContext
 from discord.ext import commands
@@ -18,6 +26,57 @@ from selenium.webdriver.support.wait import WebDriverWait
 from util.embed_builder import EmbedBuilder
 from util.Logging import Log, limit
 
+COPYLEAKS_URL = "https://app.copyleaks.com/v1/scan/ai/embedded"
+DRIVER_POOL_SIZE = int(os.getenv("DETECT_AI_DRIVER_POOL_SIZE", "2"))
+RATE_LIMIT_ERROR_XPATH = "/html/body/app-root/div/app-scan-inline-widget-layout/app-error-page/div/div/span/div/b"
+# reads the result straight out of the DOM, instead of serializing the whole page and parsing it again.
+# only the spans which have both attributes are scan parts, and parts with malformed numbers are skipped.
+SCAN_RESULT_SCRIPT = """
+// unlike parseInt / parseFloat, Number() rejects trailing junk such as "3.7" or "0.9x"
+const toNumber = value => (value.trim() === "" ? NaN : Number(value));
+const result = document.querySelector(".scan-text-editor-result");
+return {
+    text: result.textContent.trim(),
+    parts: Array.from(result.querySelectorAll("span[cl-scan-words][cl-scan-probability]"))
+        .map(span => ({
+            words: toNumber(span.getAttribute("cl-scan-words")),
+            probability: toNumber(span.getAttribute("cl-scan-probability")),
+            human: span.hasAttribute("cl-human-match"),
+            text: span.textContent.trim(),
+        }))
+        .filter(part => Number.isInteger(part.words) && Number.isFinite(part.probability)),
+};
+"""
+RESULT_CACHE_FILE = "util/detect_ai_cache"
+RESULT_CACHE_TTL = 24 * 60 * 60  # seconds
+
+CHROME_ARGUMENTS = (
+    # the bare flag is what makes undetected_chromedriver apply its headless patches
+    # (user agent, navigator.webdriver), it picks the `=new` variant by itself
+    "--headless",
+    "--no-sandbox",
+    "--disable-gpu",
+    "--disable-dev-shm-usage",
+    "--blink-settings=imagesEnabled=false",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-sync",
+    "--mute-audio",
+)
+# only the DOM is read, so skip downloading images and fonts (stylesheets are still needed for layout)
+CHROME_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.managed_default_content_settings.fonts": 2,
+    "profile.managed_default_content_settings.stylesheet": 1,
+}
+
+# 256 step gradient from red (AI) to green (human) used by `color_classification`, packed as r, g, b bytes
+COLOR_GRADIENT = bytes(
+    int(channel * 255)
+    for step in range(256)
+    for channel in colorsys.hsv_to_rgb(step / 255 / 3, 0.85, 1)
+)
+
 
 class AuthorPredication(Enum):
     Human = "Written by a __**Human**__"
@@ -50,8 +109,10 @@ class AIDetectionResult:
         else:
             factor = 0.5 + self.confidence / 2
 
-        r, g, b = colorsys.hsv_to_rgb(factor / 3, 0.85, 1)
-        return int(r * 255) << 16 | int(g * 255) << 8 | int(b * 255)
+        i = min(max(int(factor * 255), 0), 255) * 3
+        return (
+            COLOR_GRADIENT[i] << 16 | COLOR_GRADIENT[i + 1] << 8 | COLOR_GRADIENT[i + 2]
+        )
 
     def text_summary(self) -> str:
         """
@@ -92,19 +153,83 @@ class AIDetectionResult:
         return f"Certainly {self.author_predication.value}\n{self.confidence:.1%} Confident"
 
 
+class ScanPart(TypedDict):
+    words: int
+    probability: float  # 0 - 1
+    human: bool
+    text: str
+
+
+class ScanResult(TypedDict):
+    text: str
+    parts: list[ScanPart]
+
+
 def launch_chrome() -> uc.Chrome:
     """
     Opens an undetected (and headless) chrome driver.
     :return: uc.Chrome
     """
+    # undetected_chromedriver refuses to reuse a ChromeOptions object, so only its contents are shared
     options = uc.ChromeOptions()
-    options.add_argument(
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36",
-    )
-    options.add_argument("--headless")
+    for argument in CHROME_ARGUMENTS:
+        options.add_argument(argument)
+    options.add_experimental_option("prefs", CHROME_PREFS)
     return uc.Chrome(options=options)
 
 
+class DriverPool:
+    """
+    A small pool of long-lived chrome drivers.
+    Launching chrome takes several seconds, so drivers are launched lazily (up to `size` of them)
+    and then reused between scans instead of being quit after every command.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.drivers: list[uc.Chrome] = []  # every driver launched by this pool
+        self.idle: list[uc.Chrome] = []  # drivers that are not currently in use
+        # limits the number of drivers in use at once
+        self.semaphore = asyncio.Semaphore(size)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> AsyncIterator[uc.Chrome]:
+        """
+        Borrows a driver from the pool, launching a new one if none are idle and the pool is not full.
+        The driver is reset to a blank page and returned to the pool afterwards.
+        If anything fails, the driver is quit instead, since its state is unknown.
+        """
+        async with self.semaphore:
+            if self.idle:
+                driver = self.idle.pop()
+            else:
+                driver = await asyncio.to_thread(launch_chrome)
+                self.drivers.append(driver)
+
+            try:
+                yield driver
+                await asyncio.to_thread(driver.get, "about:blank")
+            except BaseException:
+                self.drivers.remove(driver)
+                with contextlib.suppress(Exception):
+                    await asyncio.to_thread(driver.quit)
+                raise
+
+            self.idle.append(driver)
+
+    def quit_all(self) -> None:
+        """
+        Quits every driver launched by this pool.
+        """
+        for driver in self.drivers:
+            with contextlib.suppress(Exception):
+                driver.quit()
+        self.drivers.clear()
+
+
+driver_pool = DriverPool(DRIVER_POOL_SIZE)
+atexit.register(driver_pool.quit_all)
+
+
 def submit_text(driver: uc.Chrome, text: str) -> None:
     """
     1. finds the text field
@@ -116,92 +241,56 @@ def submit_text(driver: uc.Chrome, text: str) -> None:
     driver.find_element(By.CSS_SELECTOR, "button").click()
 
 
-def wait_for_rate_limit_error(driver: uc.Chrome, timeout: float) -> bool:
+def wait_for_processing_completion(driver: uc.Chrome) -> bool:
     """
-    Waits for the rate limit error to show up.
-    :return: True if it was found, and false otherwise.
+    Waits for the copyleaks page to finish processing the text, or to throw a rate limit error.
+    Will wait a maximum of 20 seconds before raising a TimeoutError.
+    :return: True when we were rate limited, False otherwise.
     """
     try:
-        WebDriverWait(driver, timeout).until(
-            EC.presence_of_element_located(
-                (
-                    By.XPATH,
-                    "/html/body/app-root/div/app-scan-inline-widget-layout/app-error-page/div/div/span/div/b",
+        found = WebDriverWait(driver, 20).until(
+            EC.any_of(
+                EC.presence_of_element_located((By.XPATH, RATE_LIMIT_ERROR_XPATH)),
+                EC.presence_of_element_located(
+                    (By.CSS_SELECTOR, "div.scan-text-editor-result"),
                 ),
             ),
         )
-        return True  # found it!
-    except SeleniumTimeoutException:
-        return False  # timed out... did not find it
-
-
-def wait_for_scan_result(driver: uc.Chrome, timeout: float) -> bool:
-    """
-    Waits for the scan result to show up.
-    :return: True if it was found, and false otherwise.
-    """
-    try:
-        WebDriverWait(driver, timeout).until(
-            EC.presence_of_element_located(
-                (By.CSS_SELECTOR, "div.scan-text-editor-result"),
-            ),
-        )
-        return True  # found it!
     except SeleniumTimeoutException:
-        return False  # timed out... did not find it
-
+        # did not find either within 20 seconds...
+        msg = "Failed to complete within 20 seconds."
+        raise TimeoutError(msg) from None
 
-def wait_for_processing_completion(driver: uc.Chrome) -> bool:
-    """
-    Waits for the copyleaks page to finish processing the text, or to throw a rate limit error.
-    Will wait a maximum of 20 seconds before raising a TimeoutError.
-    :return: True when we were rate limited, False otherwise.
-    """
+    # the scan result is a <div>, while the rate limit error is a <b>
+    return found.tag_name == "b"
 
-    for _ in range(10):
-        if wait_for_rate_limit_error(driver, 1):
-            return True
 
-        if wait_for_scan_result(driver, 1):
-            return False
-
-    # did not find it within 20 seconds...
-    msg = "Failed to complete within 20 seconds."
-    raise TimeoutError(msg)
-
-
-def parse_result_element(result_element: bs4.Tag) -> AIDetectionResult:
+def parse_scan_result(scan_result: ScanResult) -> AIDetectionResult:
     """
     Parses the copyleaks scan result into a pythonic AIDetectionResult.
 
-    :param result_element: The <div class="scan-text-editor-result"> element from the copyleaks page.
-    :type result_element: bs4.Tag
+    :param scan_result: the scan result, as read from the copyleaks page by `SCAN_RESULT_SCRIPT`.
+    :type scan_result: ScanResult
     :return: the parsed AIDetectionResult
     """
 
     parts: list[AIDetectionResult] = []
-    for span_element in result_element.select("span"):
-        try:
-            scan_words = int(span_element["cl-scan-words"])  # type: ignore - errors caught at runtime!
-        except (KeyError, ValueError, TypeError):
-            continue
-
-        try:
-            scan_probability = float(span_element["cl-scan-probability"])  # type: ignore - errors caught at runtime!
-        except (KeyError, ValueError, TypeError):
-            continue
-
-        author_predication = (
-            AuthorPredication.Human
-            if span_element.has_attr("cl-human-match")
-            else AuthorPredication.ArtificialIntelligence
-        )
+    part_words: list[int] = []  # `w_i` in the formula below
+    part_signed_confidences: list[float] = []  # `c_i a_i` in the formula below
+    for scan_part in scan_result["parts"]:
+        if scan_part["human"]:
+            author_predication = AuthorPredication.Human
+            part_signed_confidences.append(scan_part["probability"])
+        else:
+            author_predication = AuthorPredication.ArtificialIntelligence
+            part_signed_confidences.append(-scan_part["probability"])
+        part_words.append(scan_part["words"])
 
         parts.append(
             AIDetectionResult(
-                word_count=scan_words,
-                text=span_element.text.strip(),
-                confidence=scan_probability,
+                word_count=scan_part["words"],
+                text=scan_part["text"],
+                confidence=scan_part["probability"],
                 author_predication=author_predication,
                 parts=[],  # individual parts are not broken down further
             ),
@@ -221,14 +310,10 @@ def parse_result_element(result_element: bs4.Tag) -> AIDetectionResult:
     # The sign of the result indicates the author (negative being AI, positive being Human),
     # and the absolute value indicates the confidence.
 
-    total_words = 0
-    total_signed_confidence = 0
-    for part in parts:
-        total_words += part.word_count
-        if part.author_predication == AuthorPredication.Human:
-            total_signed_confidence += part.confidence * part.word_count
-        else:
-            total_signed_confidence -= part.confidence * part.word_count
+    total_words = sum(part_words)
+    total_signed_confidence = sum(
+        map(operator.mul, part_words, part_signed_confidences),
+    )
 
     overall_signed_confidence = total_signed_confidence / total_words
     if overall_signed_confidence < 0:
@@ -240,35 +325,129 @@ def parse_result_element(result_element: bs4.Tag) -> AIDetectionResult:
 
     return AIDetectionResult(
         word_count=total_words,
-        text=result_element.text.strip(),
+        text=scan_result["text"],
         author_predication=overall_author_predication,
         confidence=overall_confidence,
         parts=parts,
     )
 
 
-def detect_ai(text: str) -> AIDetectionResult:
+async def detect_ai(text: str) -> AIDetectionResult:
     """
     Uses copyleaks to process the text and parses the result.
     See live demo: https://app.copyleaks.com/v1/scan/ai/embedded
+    Every blocking step is run in a separate thread, so the event loop is never blocked.
     :param text: the source text which may have been partially or fully written by AI or humans.
     :type text: str
     :return: a AIDetectionResult
     """
-    driver = launch_chrome()
-    driver.get("https://app.copyleaks.com/v1/scan/ai/embedded")
-    submit_text(driver, text)
-    if wait_for_processing_completion(driver):
-        driver.quit()
-        msg = "You have reached your limit for the day. Please try again tomorrow."
-        raise Exception(msg)
+    async with driver_pool.acquire() as driver:
+        await asyncio.to_thread(driver.get, COPYLEAKS_URL)
+        await asyncio.to_thread(submit_text, driver, text)
+        if await asyncio.to_thread(wait_for_processing_completion, driver):
+            msg = "You have reached your limit for the day. Please try again tomorrow."
+            raise Exception(msg)
+
+        scan_result: ScanResult = await asyncio.to_thread(
+            driver.execute_script,
+            SCAN_RESULT_SCRIPT,
+        )
+
+    return parse_scan_result(scan_result)
+
+
+def prefilter_text(text: str) -> str | None:
+    """
+    Cheap checks that reject text which is not worth scanning, before a chrome driver is used.
+    :param text: the text submitted by the user
+    :type text: str
+    :return: a description of the problem, or None if the text can be scanned.
+    """
+    text = text.strip()
+
+    if len(text) < 150:
+        return "You must enter at least 150 characters."
 
-    soup = bs4.BeautifulSoup(driver.page_source, "html.parser")
-    driver.quit()
+    if len(text.split()) < 30:
+        return "You must enter at least 30 words."
 
-    result_element = soup.select_one(".scan-text-editor-result")
-    assert result_element, "`wait_for_processing_completion` verified that this exists"
-    return parse_result_element(result_element)
+    # copyleaks only classifies prose, long strings of numbers, symbols or code just waste a scan
+    if sum(map(str.isalpha, text)) < len(text) / 2:
+        return "The text must mostly consist of words, not numbers, symbols or code."
+
+    return None
+
+
+# maps the hash of a scanned text to (unix timestamp of the scan, result)
+# only ever accessed from the event loop, so it does not need a lock
+result_cache: TTLCache[str, tuple[float, AIDetectionResult]] = TTLCache(
+    maxsize=1024,
+    ttl=RESULT_CACHE_TTL,
+)
+
+
+def result_cache_key(text: str) -> str:
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def load_result_cache() -> None:
+    """
+    Loads the results saved by `save_result_cache`, skipping any that have since expired.
+    """
+    # read only, so that nothing is created on disk when there is no saved cache yet
+    with contextlib.suppress(Exception):
+        with shelve.open(RESULT_CACHE_FILE, flag="r") as shelf:
+            for key, (scanned_at, result) in shelf.items():
+                if time.time() - scanned_at < RESULT_CACHE_TTL:
+                    result_cache[key] = (scanned_at, result)
+
+
+def save_result_cache() -> None:
+    """
+    Saves the cached results to disk so that they survive a restart.
+    """
+    with shelve.open(RESULT_CACHE_FILE, flag="n") as shelf:
+        shelf.update(result_cache.items())
+
+
+load_result_cache()
+atexit.register(save_result_cache)
+
+
+# scans that are currently running, by cache key
+in_flight_scans: dict[str, asyncio.Task[AIDetectionResult]] = {}
+
+
+async def scan_and_cache(key: str, text: str) -> AIDetectionResult:
+    try:
+        result = await detect_ai(text)
+        result_cache[key] = (time.time(), result)
+        return result
+    finally:
+        del in_flight_scans[key]
+
+
+async def detect_ai_cached(text: str) -> AIDetectionResult:
+    """
+    Same as `detect_ai`, but repeated submissions of the same text are answered from the cache.
+    Identical texts submitted while a scan is still running wait for that scan instead of starting another.
+    Different texts are scanned concurrently, up to the size of the driver pool.
+    Errors (such as being rate limited) are not cached.
+    :param text: the source text which may have been partially or fully written by AI or humans.
+    :type text: str
+    :return: a AIDetectionResult
+    """
+    key = result_cache_key(text)
+    # restored entries get a fresh TTL in `result_cache`, so check the scan time too
+    cached = result_cache.get(key)
+    if cached is not None and time.time() - cached[0] < RESULT_CACHE_TTL:
+        return cached[1]
+
+    if (scan := in_flight_scans.get(key)) is None:
+        scan = in_flight_scans[key] = asyncio.create_task(scan_and_cache(key, text))
+
+    # shielded, so that one cancelled command does not cancel the scan for everyone else waiting on it
+    return await asyncio.shield(scan)
 
 
 class AI(commands.Cog):
@@ -301,12 +480,15 @@ class AI(commands.Cog):
         :return: The function is not returning anything, it is using the `await` keyword to send responses
         to the user in the Discord chat.
         """
-        if not isinstance(ctx.channel, discord.TextChannel):
-            return
-        if not ctx.channel.category or not ctx.channel.category.name.lower().endswith(
-            "help",
+        # defer before doing anything else, discord only gives us 3 seconds to respond
+        await ctx.defer(ephemeral=True)
+
+        if (
+            not isinstance(ctx.channel, discord.TextChannel)
+            or not ctx.channel.category
+            or not ctx.channel.category.name.lower().endswith("help")
         ):
-            await ctx.respond(
+            await ctx.followup.send(
                 embed=EmbedBuilder(
                     title="Error",
                     description="This command can only be run in a help channel.",
@@ -315,22 +497,20 @@ class AI(commands.Cog):
             )
             return
 
-        if len(text) < 150:
-            await ctx.respond(
+        if (problem := prefilter_text(text)) is not None:
+            await ctx.followup.send(
                 embed=EmbedBuilder(
                     title="Error",
-                    description="You must enter at least 150 characters.",
+                    description=problem,
                 ).build(),
                 ephemeral=True,
             )
             return
 
-        await ctx.defer(ephemeral=True)
-
         try:
-            result = await asyncio.to_thread(detect_ai, text)
+            result = await detect_ai_cached(text)
         except Exception as e:
-            await ctx.respond(
+            await ctx.followup.send(
                 embed=EmbedBuilder(
                     title="Error",
                     description=f"An error occurred while running the command:\n\n{e}",
@@ -356,7 +536,7 @@ class AI(commands.Cog):
                 ],
             )
 
-        await ctx.respond(embed=embed_builder.build(), ephemeral=True)
+        await ctx.followup.send(embed=embed_builder.build(), ephemeral=True)
         Log(f"$ used the detect-ai command in {ctx.channel.name}", ctx.author)
 
 
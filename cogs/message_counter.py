@@ -1,22 +1,51 @@
+import asyncio
+import atexit
 import sqlite3
+import threading
+import traceback
+from collections import Counter
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
+
+# adds users that are not in the database yet, and increments the counts of those that are
+UPSERT_COUNTS = """
+INSERT INTO user VALUES (?, ?, False, NULL, ?, NULL)
+ON CONFLICT(uid) DO UPDATE SET
+    messagesSent = messagesSent + excluded.messagesSent,
+    helpMessagesSent = helpMessagesSent + excluded.helpMessagesSent
+"""  # See ERD.mdj
 
 
 class MessageCounter(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
-        self.db = sqlite3.connect("util/database.sqlite")
-        self.cursor = self.db.cursor()
+        # counts are written from a worker thread, see `flush_pending`
+        self.db = sqlite3.connect("util/database.sqlite", check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        # makes sure only one thread writes to the connection at a time
+        self.write_lock = threading.Lock()
+
+        # messages counted since the last flush, by user id
+        self.pending_messages: Counter[int] = Counter()
+        self.pending_help_messages: Counter[int] = Counter()
+        self.flush_pending.start()
+
+        # cog_unload is not called when the bot process exits
+        atexit.register(self.write_all_pending)
+
+    def cog_unload(self) -> None:
+        self.flush_pending.cancel()
+        atexit.unregister(self.write_all_pending)
+        self.write_all_pending()
 
     @commands.Cog.listener()
     async def on_message(self, message: commands.Context) -> None:
         """
-        It adds a user to the database if they don't exist, and updates their message count if they do
+        It counts the message in memory. The counts are added to the database by `flush_pending`.
 
         :param message: The message object that triggered the event
-        :return: The amount of messages a user has sent.
         """
 
         # Ignore messages from bots
@@ -26,55 +55,55 @@ class MessageCounter(commands.Cog):
         if isinstance(message.channel, discord.DMChannel):
             return
 
-        messages_sent = (
-            None
-            if (
-                sent := self.cursor.execute(
-                    "SELECT messagesSent, helpMessagesSent FROM user WHERE uid = ?",
-                    (message.author.id,),
-                ).fetchall()
-            )
-            == []
-            else sent
-        )
-
         # Fetch the category name of the channel the message was sent in
         category_name = message.channel.category.name.lower()
 
-        # If a user is not in db, add them
-        if messages_sent is None:
-            self.add_user(message.author.id)
-            messages_sent = (0, 0)
-        else:
-            messages_sent = messages_sent[0]
-
-        # If the message was sent in a help channel, update the helpMessagesSent column
+        self.pending_messages[message.author.id] += 1
         if "help" in category_name:
-            self.update_help_user(message.author.id, messages_sent[1] + 1)
-
-        # Update the messagesSent column
-        self.update_user(message.author.id, messages_sent[0] + 1)
-
-        # commit changes
-        self.db.commit()
-
-    def add_user(self, uid: int) -> None:
-        self.cursor.execute(
-            "INSERT INTO user VALUES (?, ?, ?, ?, ?, ?)",
-            (uid, 0, False, None, 0, None),
-        )  # See ERD.mdj
+            self.pending_help_messages[message.author.id] += 1
+
+    @tasks.loop(seconds=10)
+    async def flush_pending(self) -> None:
+        # the swap happens on the event loop, so no messages are missed while the thread is writing
+        counts = self.take_pending()
+        try:
+            await asyncio.to_thread(self.write_counts, counts)
+        except Exception:
+            # most likely the database is locked, so keep the counts for the next flush.
+            # the exception is not re-raised, since that would stop the loop.
+            traceback.print_exc()
+            for uid, amount, help_amount in counts:
+                self.pending_messages[uid] += amount
+                self.pending_help_messages[uid] += help_amount
+
+    def write_all_pending(self) -> None:
+        """
+        Writes the pending counts immediately, waiting for a running flush to finish first.
+        """
+        self.write_counts(self.take_pending())
 
-    def update_user(self, uid: int, amount: int) -> None:
-        self.cursor.execute(
-            "UPDATE user SET messagesSent = ? WHERE uid = ?",
-            (amount, uid),
+    def take_pending(self) -> list[tuple[int, int, int]]:
+        """
+        Swaps out the pending counts for empty ones.
+        :return: a list of (uid, messages sent, help messages sent) since the last call
+        """
+        messages, self.pending_messages = self.pending_messages, Counter()
+        help_messages, self.pending_help_messages = (
+            self.pending_help_messages,
+            Counter(),
         )
+        return [(uid, amount, help_messages[uid]) for uid, amount in messages.items()]
 
-    def update_help_user(self, uid: int, amount: int) -> None:
-        self.cursor.execute(
-            "UPDATE user SET helpMessagesSent = ? WHERE uid = ?",
-            (amount, uid),
-        )
+    def write_counts(self, counts: list[tuple[int, int, int]]) -> None:
+        """
+        Adds the counts to the database in a single transaction.
+        Users that are not in the database yet are added.
+        """
+        if not counts:
+            return
+
+        with self.write_lock, self.db:
+            self.db.executemany(UPSERT_COUNTS, counts)
 
 
 def setup(bot: commands.Bot) -> None:
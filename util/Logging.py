@@ -1,15 +1,37 @@
 # !SKA#0001 24/10/2022
 
-import datetime
+import atexit
 import functools
+import logging
+import queue
 import re
 import sqlite3
-from pathlib import Path
+import time
+from logging.handlers import QueueHandler, QueueListener
 
 import discord
 
 from util.embed_builder import EmbedBuilder
 
+# Log() only puts records on this queue, the file is written to by the listener's background thread.
+# This keeps disk writes off the event loop.
+log_queue: queue.Queue[logging.LogRecord] = queue.Queue()
+
+log_file_handler = logging.FileHandler("log.txt", encoding="utf-8", delay=True)
+log_file_handler.setFormatter(
+    logging.Formatter("%(asctime)s - %(message)s", "%Y-%m-%d %H:%M:%S"),
+)
+log_file_handler.formatter.converter = time.gmtime  # timestamps are in UTC
+
+log_listener = QueueListener(log_queue, log_file_handler)
+log_listener.start()
+atexit.register(log_listener.stop)  # writes any remaining records before exiting
+
+logger = logging.getLogger("pax")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+logger.addHandler(QueueHandler(log_queue))
+
 
 def limit(_limit_level: int) -> callable:
     """
@@ -84,23 +106,19 @@ class Log:
         If a message and a user is given, Will replace $ in message with the user's name,
         depending on whether it is an old or new username.
         If no user given, will just log the message.
+        The message is written to log.txt in the background.
         """
-        with Path("log.txt").open("a", encoding="utf-8") as log_file:
-            # get current time
-            now = datetime.datetime.now(tz=datetime.timezone.utc)
-            now_str: str = now.strftime("%Y-%m-%d %H:%M:%S")
-
-            # Check if user is given
-            if user is not None:
-                if str(user.discriminator) == "0":
-                    user_name = f"@{user.name}"
-                else:
-                    user_name = f"{user.name}#{user.discriminator}"
-
-                message = re.sub(
-                    r"(?<!\/)\$",
-                    user_name,
-                    message,
-                )  # replaces $ in string to new username
-
-            log_file.write(f"{now_str} - {message}\n")
+        # Check if user is given
+        if user is not None:
+            if str(user.discriminator) == "0":
+                user_name = f"@{user.name}"
+            else:
+                user_name = f"{user.name}#{user.discriminator}"
+
+            message = re.sub(
+                r"(?<!\/)\$",
+                user_name,
+                message,
+            )  # replaces $ in string to new username
+
+        logger.info(message)
@@ -1,6 +1,7 @@
 """
 This file should be used to migrate the db from its current state to the
-new state. This file should only be used once.
+new state. Each migration only runs once, `PRAGMA user_version` keeps track
+of which migrations have already been applied, so this file is safe to re-run.
 """
 
 import sqlite3
@@ -8,15 +9,25 @@ import sqlite3
 db = sqlite3.connect("util/database.sqlite")
 c = db.cursor()
 
+version = c.execute("PRAGMA user_version").fetchone()[0]
+
 """
-Alter table to include a new column
+Version 1: Alter table to include a new column
 """
-c.execute(
-    """
-ALTER TABLE alert
-ADD paused BOOLEAN;
-""",
-)
+if version < 1:
+    try:
+        c.execute(
+            """
+        ALTER TABLE alert
+        ADD paused BOOLEAN;
+        """,
+        )
+    except sqlite3.OperationalError as e:
+        # the column already exists (e.g. the db was created by a newer db_builder.py)
+        # anything else means the migration did not run, so the version must not be bumped
+        if "duplicate column name" not in str(e):
+            raise
+    c.execute("PRAGMA user_version = 1")
 
 db.commit()
 db.close()